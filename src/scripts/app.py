@@ -1,8 +1,9 @@
 import os
 from repository_manager import RepositoryManager
 from langchain_parser import parse_deployment_chat
-from repository_analysis import check_configurations
+from repository_analysis import check_configurations, check_tree_configurations
 from deploy_app import deploy_to_vm
+from vm_pool import VMPool
 from langchain_parser import parse_deployment_chat
 
 def main():
@@ -13,6 +14,7 @@ def main():
       3. Use langchain_parser to extract necessary information.
       4. Run repository_analysis to generate install_dependencies.ps1.
       5. Finally, deploy to Azure VM using Terraform via deploy_app.
+         Set DEPLOYAI_VM_POOL_SIZE to take the VM from a warm pool instead.
     """
 
     # 1. Prompt for repo path and instructions
@@ -26,9 +28,20 @@ def main():
         print("No instructions provided (continuing without instructions).")
 
     # 2. Retrieve the code base into ./workspace
-    manager = RepositoryManager(workspace_dir="./workspace")
-    local_repo_path = manager.get_repository(repo_input)
-    if not local_repo_path:
+    #    Set DEPLOYAI_WORKSPACE_MAX_BYTES to cap the workspace size; the least
+    #    recently used repositories are then evicted in the background.
+    #    GitHub repositories are read from a bare clone's git tree, so no working
+    #    tree is checked out; ZIP inputs are extracted as before.
+    max_workspace_bytes = os.getenv("DEPLOYAI_WORKSPACE_MAX_BYTES")
+    manager = RepositoryManager(
+        workspace_dir="./workspace",
+        max_workspace_bytes=int(max_workspace_bytes) if max_workspace_bytes else None
+    )
+    if manager.is_github_url(repo_input):
+        local_repo_path = manager.get_repository_tree(repo_input)
+    else:
+        local_repo_path = manager.get_repository(repo_input)
+    if local_repo_path is None:
         print("Failed to retrieve repository. Exiting.")
         return
 
@@ -36,10 +49,24 @@ def main():
     info = parse_deployment_chat(instructions)
 
     # 4. Run repository_analysis to generate install_dependencies.ps1
-    check_configurations(local_repo_path)
+    if isinstance(local_repo_path, str):
+        check_configurations(local_repo_path)
+    else:
+        check_tree_configurations(local_repo_path)
 
     # 5. Deploy to Azure VM using Terraform via deploy_app.
-    deploy_to_vm(local_repo_path, info)
+    #    The parsed details only configure a new pool; an existing pool keeps the
+    #    configuration saved when it was created.
+    pool_size = int(os.getenv("DEPLOYAI_VM_POOL_SIZE", "0"))
+    pool = VMPool(info, pool_size=pool_size) if pool_size > 0 else None
+    try:
+        deploy_to_vm(local_repo_path, info, pool)
+    finally:
+        if pool:
+            # Let the replenishing apply finish so the pool is ready for the next
+            # deploy and its Terraform state is not left locked
+            print("Waiting for the VM pool to be replenished...")
+            pool.shutdown()
 
 if __name__ == "__main__":
     main()
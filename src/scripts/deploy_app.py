@@ -1,7 +1,16 @@
 import os
+import posixpath
 import shutil
+import stat
 import subprocess
+import zipfile
+from typing import Optional
 from terraform_manager import generate_terraform_config, deploy_with_terraform
+from vm_pool import VMPool
+
+# Upper bound on waiting for a pooled VM that is still being provisioned;
+# acquire() returns at once when nothing is in flight or provisioning failed
+POOL_ACQUIRE_TIMEOUT = 15 * 60
 
 def zip_application(source_dir: str) -> str:
     """Zips the application files using the folder name as the zip file name."""
@@ -9,17 +18,88 @@ def zip_application(source_dir: str) -> str:
     shutil.make_archive(base_name, 'zip', source_dir)
     return f"{base_name}.zip"
 
-def deploy_to_vm(source_dir: str, vm_details: dict) -> bool:
-    """Deploy application to Azure VM using Azure CLI."""
+def zip_tree(tree, base_name: str) -> str:
+    """
+    Zips the blobs of a git tree object (see RepositoryManager.get_repository_tree)
+    by streaming them from the object database, without a working tree on disk.
+    Like shutil.make_archive, symlinks are followed: a link to a file inside
+    `tree` is stored with that file's contents. Links to directories or to
+    paths outside `tree` are skipped with a warning.
+    """
+    zip_file = f"{base_name}.zip"
+    prefix = f"{tree.path}/" if tree.path else ""
+    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for item in tree.traverse():
+            # Directories are implied by file paths; submodules have no blobs here
+            if item.type != 'blob':
+                continue
+            arcname = item.path[len(prefix):]
+            blob = _resolve_symlink(tree, item) if stat.S_ISLNK(item.mode) else item
+            if blob is None:
+                print(f"Skipping symlink {arcname}: it does not point to a file inside the archived tree")
+                continue
+            info = zipfile.ZipInfo(arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = blob.mode << 16
+            # Lets zipfile pick ZIP64 up front for blobs over 2 GiB
+            info.file_size = blob.size
+            with archive.open(info, 'w') as dest:
+                shutil.copyfileobj(blob.data_stream, dest)
+    return zip_file
+
+def _resolve_symlink(tree, link):
+    """Follows a symlink blob to the regular file blob it points at within `tree`, or None"""
+    prefix = f"{tree.path}/" if tree.path else ""
+    # Bounded so link cycles cannot loop forever
+    for _ in range(8):
+        target = link.data_stream.read().decode('utf-8', 'surrogateescape')
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(link.path), target))
+        if posixpath.isabs(target) or path.startswith('..') or not path.startswith(prefix):
+            return None
+        try:
+            link = tree / path[len(prefix):]
+        except KeyError:
+            return None
+        if link.type != 'blob':
+            return None
+        if not stat.S_ISLNK(link.mode):
+            return link
+    return None
+
+def package_application(source) -> str:
+    """Builds the deployment zip from either a source directory or a git tree object."""
+    if isinstance(source, str):
+        return zip_application(source)
+    repo_dir = source.repo.working_tree_dir or source.repo.git_dir
+    repo_name = os.path.basename(os.path.normpath(repo_dir)).replace('.git', '')
+    base_name = f"{repo_name}_{os.path.basename(source.path)}" if source.path else repo_name
+    return zip_tree(source, base_name)
+
+def deploy_to_vm(source_dir, vm_details: dict, pool: Optional[VMPool] = None) -> bool:
+    """
+    Deploy application to Azure VM using Azure CLI.
+    `source_dir` may also be a git tree object, in which case the zip is
+    streamed straight from the repository's object database.
+    If a `pool` is given, a pre-provisioned VM is taken from it instead of
+    provisioning one; if the deployment fails for any reason that VM is
+    released back to the pool. On success it stays leased until released with
+    `python vm_pool.py release <slot>`.
+    """
+    pooled_vm = pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT) if pool else None
+    deployed = False
     try:
         # 1. First provision the VM using Terraform
-        print("Provisioning VM with Terraform...")
-        generate_terraform_config(vm_details)
-        deploy_with_terraform()
+        if pooled_vm:
+            vm_details = pooled_vm
+            print(f"Using pre-provisioned VM {vm_details['vm_name']}...")
+        else:
+            print("Provisioning VM with Terraform...")
+            generate_terraform_config(vm_details)
+            deploy_with_terraform()
 
         # 2. Zip the application
         print("Zipping application...")
-        zip_file = zip_application(source_dir)
+        zip_file = package_application(source_dir)
 
         # 3. Upload the zip file to VM
         print(f"Uploading {zip_file} to VM...")
@@ -51,12 +131,21 @@ def deploy_to_vm(source_dir: str, vm_details: dict) -> bool:
         ], check=True)
 
         print("Deployment completed successfully!")
+        if pooled_vm:
+            pool.mark_deployed(pooled_vm)
+            print(f"Deployed to pooled VM {vm_details['vm_name']} (slot {vm_details['pool_slot']}). "
+                  f"Release it with: python vm_pool.py release {vm_details['pool_slot']}")
+        deployed = True
         return True
 
     except subprocess.CalledProcessError as e:
         print(f"Deployment failed: {str(e)}")
         return False
 
+    finally:
+        if pooled_vm and not deployed:
+            pool.release(pooled_vm)
+
 def main():
     """Main deployment function."""
     # Configuration for VM and deployment
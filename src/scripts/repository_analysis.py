@@ -27,6 +27,30 @@ def check_configurations(workspace_path: str = "./workspace") -> dict:
 
     return result
 
+def check_tree_configurations(tree) -> dict:
+    """
+    Same as check_configurations, but scans a git tree object (see
+    RepositoryManager.get_repository_tree) instead of a checked-out directory.
+    Only file names are inspected, so no blob contents are read.
+    """
+    result = {
+        "has_requirements": False,
+        "has_package_json": False
+    }
+
+    for item in tree.traverse():
+        if item.type != "blob":
+            continue
+        if item.name.lower() == "requirements.txt":
+            result["has_requirements"] = True
+        elif item.name.lower() == "package.json":
+            result["has_package_json"] = True
+
+        if result["has_requirements"] and result["has_package_json"]:
+            return result
+
+    return result
+
 def generate_dependency_script(has_package_json: bool, has_requirements: bool) -> None:
     """
     Creates a PowerShell script that installs Node or Python if needed,
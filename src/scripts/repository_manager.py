@@ -1,15 +1,58 @@
 import os
 import git
+import time
+import functools
 from typing import Optional
 import shutil
 import zipfile
 import re
 import stat
+import queue
+import tempfile
+import threading
+import uuid
+
+# Prefixes for workspace entries that are in flight and never served or evicted
+STAGING_PREFIX = ".staging-"
+TRASH_PREFIX = ".trash-"
 
 class RepositoryManager:
-    def __init__(self, workspace_dir: str = "./workspace"):
+    def __init__(self, workspace_dir: str = "./workspace", max_workspace_bytes: Optional[int] = None,
+                 eviction_grace_seconds: int = 60 * 60, stale_staging_seconds: int = 24 * 60 * 60):
+        """
+        Args:
+            workspace_dir (str): Directory holding the cloned/extracted repositories.
+            max_workspace_bytes (int, optional): Size cap for the workspace. When set,
+                the least recently used repositories are evicted in the background
+                after each retrieval.
+            eviction_grace_seconds (int): Repositories used more recently than this are
+                never evicted, since another deploy sharing the workspace may still be
+                packaging them. The cap can be exceeded until they age out.
+            stale_staging_seconds (int): Staging directories older than this are taken
+                to be abandoned by a crashed run and removed at startup. Younger ones
+                may belong to another live manager and are left alone.
+        """
         self.workspace_dir = workspace_dir
+        self.max_workspace_bytes = max_workspace_bytes
+        self.eviction_grace_seconds = eviction_grace_seconds
         os.makedirs(workspace_dir, exist_ok=True)
+
+        # Cached tree sizes for eviction, keyed by path: (inode, size in bytes)
+        self._sizes = {}
+
+        # Old trees are renamed aside and deleted here, off the deploy's critical path.
+        # Eviction runs on the same thread so its directory walks stay off it too.
+        self._tasks = queue.Queue()
+        self._reaper = threading.Thread(target=self._reap, name="workspace-reaper", daemon=True)
+        self._reaper.start()
+
+        # Pick up leftovers from runs that exited before the reaper finished
+        now = time.time()
+        for entry in os.scandir(workspace_dir):
+            if entry.name.startswith(TRASH_PREFIX):
+                self._schedule_removal(entry.path)
+            elif entry.name.startswith(STAGING_PREFIX) and now - entry.stat().st_mtime > stale_staging_seconds:
+                self._schedule_removal(entry.path)
     
     def is_github_url(self, path: str) -> bool:
         """Check if the path is a GitHub URL"""
@@ -40,14 +83,9 @@ class RepositoryManager:
         app_name = repo_name  
         local_path = os.path.join(self.workspace_dir, app_name)
         
-        # Clean up existing directory if it exists
-        self.cleanup(local_path)  # Use cleanup method instead of direct rmtree
-        
-        # Clone the repository
+        # Clone into a staging directory and swap it in once complete
         print(f"Cloning repository from {repo_url} to {local_path}")
-        git.Repo.clone_from(repo_url, local_path)
-        
-        return local_path
+        return self._replace_directory(local_path, lambda staging_path: git.Repo.clone_from(repo_url, staging_path))
     
     def _extract_zip(self, zip_path: str) -> str:
         """Extracts a zip file"""
@@ -62,27 +100,198 @@ class RepositoryManager:
         folder_name = f"app_{os.path.splitext(os.path.basename(zip_path))[0]}"
         extract_path = os.path.join(self.workspace_dir, folder_name)
         
-        # Clean up existing directory if it exists
-        self.cleanup(extract_path) 
-        
-        # Extract the zip file
+        # Extract into a staging directory and swap it in once complete
         print(f"Extracting zip file from {zip_path} to {extract_path}")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
+        def extract(staging_path: str):
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(staging_path)
             
-        return extract_path
+        return self._replace_directory(extract_path, extract)
+
+    def _replace_directory(self, target_path: str, populate) -> str:
+        """
+        Fills a fresh staging directory via `populate(staging_path)` and renames it
+        over `target_path`. If populating or swapping fails, any existing
+        `target_path` is left in place; once the new tree is in, the previous one
+        is handed to the background reaper.
+        """
+        staging_path = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.workspace_dir)
+        # mkdtemp creates the directory owner-only; match a regular checkout
+        os.chmod(staging_path, 0o755)
+        try:
+            populate(staging_path)
+        except Exception:
+            self._schedule_removal(staging_path)
+            raise
+
+        # Move the old tree aside, but only reap it once the new one is in place
+        old_path = None
+        try:
+            if os.path.exists(target_path):
+                old_path = self._trash_path(target_path)
+                os.rename(target_path, old_path)
+            os.rename(staging_path, target_path)
+        except OSError:
+            if old_path and os.path.exists(old_path):
+                os.rename(old_path, target_path)
+            self._schedule_removal(staging_path)
+            raise
+
+        if old_path:
+            self._schedule_removal(old_path)
+        self._mark_used(target_path)
+        return target_path
+
+    def _mark_used(self, repo_path: str):
+        """Records a repository as most recently used and schedules enforcement of the size cap"""
+        os.utime(repo_path)
+        # The tree may have changed in place (e.g. a fetch into a bare clone)
+        self._sizes.pop(os.path.normpath(repo_path), None)
+        if self.max_workspace_bytes is not None:
+            self._tasks.put(functools.partial(self._evict_least_recently_used, keep=repo_path))
+
+    def _evict_least_recently_used(self, keep: str):
+        """Evicts repositories, oldest use first, until the workspace fits max_workspace_bytes"""
+        entries = [
+            entry for entry in os.scandir(self.workspace_dir)
+            if entry.is_dir(follow_symlinks=False)
+            and not entry.name.startswith((STAGING_PREFIX, TRASH_PREFIX))
+        ]
+        sizes = {entry.path: self._tree_size(entry) for entry in entries}
+        total = sum(sizes.values())
+
+        now = time.time()
+        keep = os.path.normpath(keep)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_workspace_bytes:
+                break
+            if os.path.normpath(entry.path) == keep or now - entry.stat().st_mtime < self.eviction_grace_seconds:
+                continue
+            print(f"Evicting {entry.path} to keep workspace under {self.max_workspace_bytes} bytes")
+            self.cleanup(entry.path)
+            total -= sizes[entry.path]
+
+    def _tree_size(self, entry: os.DirEntry) -> int:
+        """Size of a workspace tree, walked only once per tree (a replaced tree has a new inode)"""
+        path = os.path.normpath(entry.path)
+        cached = self._sizes.get(path)
+        if cached and cached[0] == entry.inode():
+            return cached[1]
+        size = self._directory_size(entry.path)
+        self._sizes[path] = (entry.inode(), size)
+        return size
+
+    @staticmethod
+    def _directory_size(path: str) -> int:
+        """Total size in bytes of the files below `path`"""
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                try:
+                    total += os.lstat(os.path.join(root, file)).st_size
+                except OSError:
+                    pass
+        return total
     
     def cleanup(self, repo_path: str):
-        """Cleans up the extracted/downloaded repository"""
+        """
+        Cleans up the extracted/downloaded repository.
+        The directory is renamed aside immediately and deleted by a background
+        reaper thread; use wait_for_cleanup() to block until deletion finishes.
+        """
         if os.path.exists(repo_path):
-            # On Windows, make files writable before removal
-            def on_rm_error(func, path, exc_info):
-                # Make the file writable if read-only
-                os.chmod(path, stat.S_IWRITE)
-                # Try the removal again
-                os.unlink(path)
-            
-            shutil.rmtree(repo_path, onerror=on_rm_error) 
+            trash_path = self._trash_path(repo_path)
+            try:
+                os.rename(repo_path, trash_path)
+            except OSError:
+                # Could not move it aside (e.g. a file is locked), delete in place
+                self._remove_tree(repo_path)
+                return
+            self._schedule_removal(trash_path)
+
+    @staticmethod
+    def _trash_path(repo_path: str) -> str:
+        """Unique path next to `repo_path` that the reaper will delete"""
+        parent, name = os.path.split(os.path.normpath(repo_path))
+        return os.path.join(parent, f"{TRASH_PREFIX}{name}-{uuid.uuid4().hex}")
+
+    def wait_for_cleanup(self):
+        """Blocks until every queued deletion and eviction has finished"""
+        self._tasks.join()
+
+    def _schedule_removal(self, path: str):
+        """Hands a tree that is no longer served to the reaper thread"""
+        self._tasks.put(functools.partial(self._remove_tree, path))
+
+    def _reap(self):
+        """Background loop running deletions and evictions handed over by cleanup() and _mark_used()"""
+        while True:
+            task = self._tasks.get()
+            try:
+                task()
+            except Exception as e:
+                print(f"Workspace cleanup task failed: {str(e)}")
+            finally:
+                self._tasks.task_done()
+
+    @staticmethod
+    def _remove_tree(repo_path: str):
+        """Synchronously deletes a directory tree"""
+        # On Windows, make files writable before removal
+        def on_rm_error(func, path, exc_info):
+            # Another manager sharing the workspace may be reaping the same tree
+            if isinstance(exc_info[1], FileNotFoundError):
+                return
+            # Make the file writable if read-only
+            os.chmod(path, stat.S_IWRITE)
+            # Try the removal again
+            os.unlink(path)
+        
+        shutil.rmtree(repo_path, onerror=on_rm_error)
+
+    def get_repository_tree(self, repo_url: str, commit: str = "HEAD", subpath: Optional[str] = None) -> Optional[git.Tree]:
+        """
+        Checkout-free alternative to get_repository.
+        GitHub URLs are fetched into a bare clone; a local git repository is
+        opened in place. Returns the git tree object for `commit` (optionally
+        narrowed to `subpath`) so files can be read straight from the object
+        database without a working tree.
+        """
+        try:
+            if self.is_github_url(repo_url):
+                repo = self._fetch_bare_repository(repo_url)
+            elif os.path.isdir(repo_url):
+                repo = git.Repo(repo_url)
+            else:
+                raise ValueError("Path must be either a GitHub URL or a local git repository")
+
+            tree = repo.commit(commit).tree
+            if subpath:
+                tree = tree / subpath.strip('/')
+                if tree.type != 'tree':
+                    raise ValueError(f"{subpath} is not a directory in {commit}")
+            return tree
+
+        except Exception as e:
+            print(f"Failed to process repository: {str(e)}")
+            return None
+
+    def _fetch_bare_repository(self, repo_url: str) -> git.Repo:
+        """Clones a GitHub repository without a working tree, or updates an existing bare clone"""
+        repo_name = repo_url.split('/')[-1].replace('.git', '')
+        local_path = os.path.join(self.workspace_dir, f"{repo_name}.git")
+
+        if os.path.isdir(local_path):
+            # Reuse the existing object database and only fetch what changed
+            print(f"Fetching repository from {repo_url} into {local_path}")
+            repo = git.Repo(local_path)
+            repo.git.fetch(repo_url, "+refs/heads/*:refs/heads/*", "--prune")
+            self._mark_used(local_path)
+            return repo
+
+        print(f"Cloning bare repository from {repo_url} to {local_path}")
+        self._replace_directory(local_path, lambda staging_path: git.Repo.clone_from(repo_url, staging_path, bare=True))
+        return git.Repo(local_path)
 
 if __name__ == "__main__":
     # Example usage
@@ -1,7 +1,16 @@
 import subprocess
 import os
+import base64
 from typing import Dict, Tuple, Optional
 
+# Runs once on every pooled VM so it is runtime-ready before being handed out
+RUNTIME_SETUP_SCRIPT = """\
+Invoke-WebRequest -Uri "https://nodejs.org/dist/v16.20.1/node-v16.20.1-x64.msi" -OutFile "node-installer.msi"
+Start-Process msiexec.exe -Wait -ArgumentList '/i node-installer.msi /qn /norestart'
+Invoke-WebRequest -Uri "https://www.python.org/ftp/python/3.9.0/python-3.9.0-amd64.exe" -OutFile "python-installer.exe"
+Start-Process .\\python-installer.exe -Wait -ArgumentList '/quiet InstallAllUsers=1 PrependPath=1'
+"""
+
 def generate_terraform_config(details: Dict[str, str], output_path: str = "./terraform") -> None:
     """
     Generate a Terraform configuration file for provisioning a Windows VM in Azure.
@@ -117,6 +126,157 @@ output "vm_public_ip" {{
 }}
 """)
 
+def pool_resource_group_name(details: Dict[str, str]) -> str:
+    """
+    Resource group used by the VM pool. It is kept apart from the one created by
+    generate_terraform_config so the two Terraform states never manage the same group.
+    """
+    return f"{details.get('resource_group_name', 'example-resource-group')}-pool"
+
+def generate_pool_terraform_config(details: Dict[str, str], output_path: str = "./terraform_pool") -> None:
+    """
+    Generate a Terraform configuration for a pool of pre-provisioned Windows VMs in Azure.
+
+    The resource group, VNet and subnet are shared; the public IP, NIC and VM are
+    created once per key of the `pool_slots` variable (`for_each`), so slots can be
+    added or destroyed individually. Each VM runs RUNTIME_SETUP_SCRIPT on first boot.
+    The slot set is supplied through `terraform.tfvars.json` (see vm_pool.VMPool).
+    The resource group is named by pool_resource_group_name.
+
+    Args:
+        details (dict): Same keys as generate_terraform_config; `vm_name` is used
+            as the prefix for the pooled VM names.
+        output_path (str): Path to save the generated Terraform configuration file.
+
+    Returns:
+        None
+    """
+    os.makedirs(output_path, exist_ok=True)
+
+    subscription_id = details.get("subscription_id", "e6b341db-822e-4e47-8fef-a323f63c920d")
+    resource_group_name = pool_resource_group_name(details)
+    location = details.get("location", "East US")
+    vm_name = details.get("vm_name", "example-windows-vm")
+    vm_username = details.get("admin_username", "azureuser")
+    vm_password = details.get("admin_password", "Password123!")  # Use secure password
+
+    # -EncodedCommand takes base64 UTF-16LE, which sidesteps quoting inside HCL and JSON
+    encoded_setup = base64.b64encode(RUNTIME_SETUP_SCRIPT.encode("utf-16-le")).decode("ascii")
+
+    with open(os.path.join(output_path, "main.tf"), "w") as tf_file:
+        tf_file.write(f"""\
+#  Provider & Resource Group
+provider "azurerm" {{
+  features {{}}
+  # Replace with your subscription
+  subscription_id = "{subscription_id}"
+}}
+
+variable "pool_slots" {{
+  description = "Keys of the pooled VMs to keep provisioned"
+  type        = set(string)
+  default     = []
+}}
+
+resource "azurerm_resource_group" "rg" {{
+  name     = "{resource_group_name}"
+  location = "{location}"
+}}
+
+#  Virtual Network & Subnet (shared by the pool)
+resource "azurerm_virtual_network" "vnet" {{
+  name                = "pool-vnet"
+  location            = azurerm_resource_group.rg.location
+  resource_group_name = azurerm_resource_group.rg.name
+  address_space       = ["10.0.0.0/16"]
+}}
+
+resource "azurerm_subnet" "subnet" {{
+  name                 = "pool-subnet"
+  resource_group_name  = azurerm_resource_group.rg.name
+  virtual_network_name = azurerm_virtual_network.vnet.name
+  address_prefixes     = ["10.0.1.0/24"]
+}}
+
+#  Public IP & Network Interface (one per slot)
+resource "azurerm_public_ip" "public_ip" {{
+  for_each            = var.pool_slots
+  name                = "pool-${{each.key}}-public-ip"
+  location            = azurerm_resource_group.rg.location
+  resource_group_name = azurerm_resource_group.rg.name
+  allocation_method   = "Static"
+  sku                 = "Basic"
+}}
+
+resource "azurerm_network_interface" "nic" {{
+  for_each            = var.pool_slots
+  name                = "pool-${{each.key}}-nic"
+  location            = azurerm_resource_group.rg.location
+  resource_group_name = azurerm_resource_group.rg.name
+
+  ip_configuration {{
+    name                          = "ipconfig1"
+    subnet_id                     = azurerm_subnet.subnet.id
+    private_ip_address_allocation = "Dynamic"
+    public_ip_address_id          = azurerm_public_ip.public_ip[each.key].id
+  }}
+}}
+
+#  Windows VMs (one per slot)
+resource "azurerm_windows_virtual_machine" "winvm" {{
+  for_each            = var.pool_slots
+  name                = "{vm_name}-${{each.key}}"
+  computer_name       = "pool-${{each.key}}"
+  location            = azurerm_resource_group.rg.location
+  resource_group_name = azurerm_resource_group.rg.name
+  size                = "Standard_B1s"
+
+  admin_username = "{vm_username}"
+  admin_password = "{vm_password}"
+
+  network_interface_ids = [
+    azurerm_network_interface.nic[each.key].id
+  ]
+
+  os_disk {{
+    caching              = "ReadWrite"
+    storage_account_type = "Standard_LRS"
+  }}
+
+  source_image_reference {{
+    publisher = "MicrosoftWindowsServer"
+    offer     = "WindowsServer"
+    sku       = "2022-Datacenter"
+    version   = "latest"
+  }}
+}}
+
+#  Runtime installation, so handed-out VMs only need the app installed
+resource "azurerm_virtual_machine_extension" "runtime" {{
+  for_each             = var.pool_slots
+  name                 = "install-runtimes"
+  virtual_machine_id   = azurerm_windows_virtual_machine.winvm[each.key].id
+  publisher            = "Microsoft.Compute"
+  type                 = "CustomScriptExtension"
+  type_handler_version = "1.10"
+
+  settings = jsonencode({{
+    commandToExecute = "powershell -ExecutionPolicy Unrestricted -EncodedCommand {encoded_setup}"
+  }})
+}}
+
+#  Output
+output "pool_vms" {{
+  description = "Name and public IP of each pooled Windows VM, keyed by slot"
+  value = {{
+    for key in var.pool_slots : key => {{
+      vm_name   = azurerm_windows_virtual_machine.winvm[key].name
+      public_ip = azurerm_public_ip.public_ip[key].ip_address
+    }}
+  }}
+}}
+""")
+
 def run_terraform_command(command: list, working_dir: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Function to execute a Terraform command.
@@ -145,11 +305,16 @@ def run_terraform_command(command: list, working_dir: str) -> Tuple[Optional[str
         print(f"Error Output:\n{e.stderr}")
         return None, e.stderr
 
-def deploy_with_terraform() -> None:
+def deploy_with_terraform(terraform_dir: str = "./terraform") -> bool:
     """
     Function to deploy infrastructure using Terraform.
+
+    Args:
+        terraform_dir (str): The directory containing the Terraform configuration.
+
+    Returns:
+        bool: True if init, plan and apply all succeeded.
     """
-    terraform_dir = "./terraform"  
 
     # 1. Initialize Terraform
     print("Initializing Terraform...")
@@ -157,7 +322,7 @@ def deploy_with_terraform() -> None:
     _, init_error = run_terraform_command(init_command, terraform_dir)
     if init_error:
         print("Terraform init failed.")
-        return
+        return False
 
     # 2. Generate Terraform plan
     print("Generating Terraform plan...")
@@ -165,7 +330,7 @@ def deploy_with_terraform() -> None:
     _, plan_error = run_terraform_command(plan_command, terraform_dir)
     if plan_error:
         print("Terraform plan failed.")
-        return
+        return False
 
     # 3. Apply Terraform configuration
     print("Applying Terraform configuration...")
@@ -173,9 +338,10 @@ def deploy_with_terraform() -> None:
     _, apply_error = run_terraform_command(apply_command, terraform_dir)
     if apply_error:
         print("Terraform apply failed.")
-        return
+        return False
 
     print("Terraform deployment completed successfully!")
+    return True
 
 # Example usage
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 from repository_manager import RepositoryManager
 import os
 import shutil
-from repository_analysis import analyze_repository
+import tempfile
+import time
+import zipfile
+import git
+from unittest import mock
+from repository_analysis import check_configurations, check_tree_configurations
+from deploy_app import package_application
 
 def test_repository_manager():
     # Initialize the repository manager
@@ -35,6 +41,7 @@ def test_repository_manager():
                 
                 # Clean up
                 repo_manager.cleanup(repo_path)
+                repo_manager.wait_for_cleanup()
                 print("Cleanup completed")
             else:
                 print("Failed to process repository")
@@ -51,9 +58,8 @@ def test_repository_analysis():
             "name": "Flask Hello World",
             "source": "https://github.com/Arvo-AI/hello_world",
             "expected": {
-                "hasDockerfile": False,
-                "frameworks": ["Flask"],
-                "exposedPorts": [5000],
+                "has_requirements": True,
+                "has_package_json": False,
             }
         }
         # Add more test cases as needed
@@ -61,6 +67,7 @@ def test_repository_analysis():
     
     for test in test_cases:
         print(f"\nTesting analysis for: {test['name']}")
+        repo_path = None
         try:
             # Get repository
             repo_path = repo_manager.get_repository(test["source"])
@@ -69,18 +76,13 @@ def test_repository_analysis():
                 continue
                 
             # Analyze repository
-            analysis = analyze_repository(repo_path)
+            analysis = check_configurations(repo_path)
             print(f"Analysis results: {analysis}")
             
             # Verify expected results
             for key, expected_value in test["expected"].items():
                 actual_value = analysis[key]
-                if key in ["frameworks", "exposedPorts"]:
-                    # For lists, check if all expected items are present
-                    all_present = all(item in actual_value for item in expected_value)
-                    assert all_present, f"Expected {expected_value} to be in {actual_value}"
-                else:
-                    assert actual_value == expected_value, f"Expected {expected_value} but got {actual_value}"
+                assert actual_value == expected_value, f"Expected {expected_value} but got {actual_value}"
                 print(f"✓ Verified {key}: {actual_value}")
             
         except Exception as e:
@@ -91,6 +93,178 @@ def test_repository_analysis():
             if repo_path and os.path.exists(repo_path):
                 shutil.rmtree(repo_path)
 
+def test_repository_tree_packaging():
+    """Test checkout-free analysis and packaging from a local bare repository"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # Build a small source repository and a bare clone of it
+        source_path = os.path.join(tmp, "source")
+        os.makedirs(os.path.join(source_path, "app", "static"))
+        files = {
+            "README.md": "outside the subpath\n",
+            "app/requirements.txt": "flask\n",
+            "app/main.py": "print('hello')\n",
+            "app/static/index.html": "<h1>hello</h1>\n",
+        }
+        for name, content in files.items():
+            with open(os.path.join(source_path, name), "w") as f:
+                f.write(content)
+        os.symlink("main.py", os.path.join(source_path, "app", "link.py"))
+        os.symlink("../README.md", os.path.join(source_path, "app", "escape.md"))
+
+        source = git.Repo.init(source_path)
+        source.index.add(list(files) + ["app/link.py", "app/escape.md"])
+        author = git.Actor("Test", "test@example.com")
+        source.index.commit("Initial commit", author=author, committer=author)
+        bare_path = os.path.join(tmp, "hello_world.git")
+        git.Repo.clone_from(source_path, bare_path, bare=True)
+
+        repo_manager = RepositoryManager(workspace_dir=os.path.join(tmp, "workspace"))
+        tree = repo_manager.get_repository_tree(bare_path, subpath="app")
+        assert tree is not None, "Failed to read the repository tree"
+
+        # Analysis only sees the files below the subpath
+        assert check_tree_configurations(tree) == {"has_requirements": True, "has_package_json": False}
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            zip_file = package_application(tree)
+        finally:
+            os.chdir(cwd)
+
+        assert zip_file == "hello_world_app.zip", f"Unexpected archive name {zip_file}"
+        with zipfile.ZipFile(os.path.join(tmp, zip_file)) as archive:
+            # Subpath prefix is stripped; the link escaping the subpath is skipped
+            assert sorted(archive.namelist()) == ["link.py", "main.py", "requirements.txt", "static/index.html"]
+            assert archive.read("main.py") == b"print('hello')\n"
+            assert archive.read("link.py") == b"print('hello')\n"
+            assert archive.read("static/index.html") == b"<h1>hello</h1>\n"
+        print("✓ Verified checkout-free packaging")
+
+def _make_zip(zip_path, files):
+    """Writes a zip file containing `files` (name -> text content)"""
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+
+def _make_tree(path, size, mtime):
+    """Creates a workspace tree holding `size` bytes, last used at `mtime`"""
+    os.makedirs(path)
+    with open(os.path.join(path, "data.bin"), "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+def test_workspace_replace_directory():
+    """Test that trees are swapped in whole and a failed retrieval keeps the old one"""
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = os.path.join(tmp, "workspace")
+        repo_manager = RepositoryManager(workspace_dir=workspace)
+
+        first_zip = os.path.join(tmp, "v1", "app.zip")
+        _make_zip(first_zip, {"one.txt": "one"})
+        repo_path = repo_manager.get_repository(first_zip)
+        assert os.listdir(repo_path) == ["one.txt"]
+
+        # Replacing an existing tree leaves only the new content
+        second_zip = os.path.join(tmp, "v2", "app.zip")
+        _make_zip(second_zip, {"two.txt": "two"})
+        assert repo_manager.get_repository(second_zip) == repo_path
+        assert os.listdir(repo_path) == ["two.txt"]
+
+        # A failed populate keeps the existing target untouched
+        def failing_populate(staging_path):
+            with open(os.path.join(staging_path, "partial.txt"), "w") as f:
+                f.write("partial")
+            raise IOError("download interrupted")
+
+        try:
+            repo_manager._replace_directory(repo_path, failing_populate)
+            assert False, "Expected the failed populate to raise"
+        except IOError:
+            pass
+        assert os.listdir(repo_path) == ["two.txt"]
+
+        # Neither staging nor trash directories are left behind
+        repo_manager.wait_for_cleanup()
+        assert os.listdir(workspace) == ["app_app"]
+        print("✓ Verified workspace replacement")
+
+def test_workspace_failed_swap_keeps_target():
+    """Test that a failed rename-in restores the old tree and discards the staged one"""
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = os.path.join(tmp, "workspace")
+        repo_manager = RepositoryManager(workspace_dir=workspace)
+
+        first_zip = os.path.join(tmp, "v1", "app.zip")
+        _make_zip(first_zip, {"one.txt": "one"})
+        repo_path = repo_manager.get_repository(first_zip)
+
+        rename = os.rename
+        def failing_rename(src, dst):
+            if os.path.basename(src).startswith(".staging-"):
+                raise PermissionError("target is in use")
+            rename(src, dst)
+
+        second_zip = os.path.join(tmp, "v2", "app.zip")
+        _make_zip(second_zip, {"two.txt": "two"})
+        with mock.patch("repository_manager.os.rename", failing_rename):
+            assert repo_manager.get_repository(second_zip) is None
+
+        repo_manager.wait_for_cleanup()
+        assert os.listdir(repo_path) == ["one.txt"]
+        assert os.listdir(workspace) == ["app_app"]
+        print("✓ Verified failed swap")
+
+def test_workspace_lru_eviction():
+    """Test that the least recently used trees are evicted first and `keep` is protected"""
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = os.path.join(tmp, "workspace")
+        repo_manager = RepositoryManager(workspace_dir=workspace, max_workspace_bytes=250,
+                                         eviction_grace_seconds=0)
+        now = time.time()
+        _make_tree(os.path.join(workspace, "old"), 100, now - 300)
+        _make_tree(os.path.join(workspace, "mid"), 100, now - 200)
+        _make_tree(os.path.join(workspace, "new"), 100, now - 100)
+
+        repo_manager._evict_least_recently_used(keep=os.path.join(workspace, "new"))
+        repo_manager.wait_for_cleanup()
+        assert sorted(os.listdir(workspace)) == ["mid", "new"]
+
+        # The kept tree survives even when it is the least recently used
+        _make_tree(os.path.join(workspace, "old"), 100, now - 300)
+        repo_manager._evict_least_recently_used(keep=os.path.join(workspace, "old"))
+        repo_manager.wait_for_cleanup()
+        assert sorted(os.listdir(workspace)) == ["new", "old"]
+
+        # Recently used trees are never evicted
+        _make_tree(os.path.join(workspace, "mid"), 100, now - 200)
+        repo_manager.eviction_grace_seconds = 60 * 60
+        repo_manager._evict_least_recently_used(keep=os.path.join(workspace, "new"))
+        repo_manager.wait_for_cleanup()
+        assert sorted(os.listdir(workspace)) == ["mid", "new", "old"]
+        print("✓ Verified LRU eviction")
+
+def test_workspace_reaps_leftovers():
+    """Test that abandoned trash and staging directories are removed at startup"""
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = os.path.join(tmp, "workspace")
+        two_days_ago = time.time() - 2 * 24 * 60 * 60
+        _make_tree(os.path.join(workspace, ".trash-app-0123"), 10, time.time())
+        _make_tree(os.path.join(workspace, ".staging-abandoned"), 10, two_days_ago)
+        # May belong to another manager that is still populating it
+        _make_tree(os.path.join(workspace, ".staging-in-progress"), 10, time.time())
+
+        repo_manager = RepositoryManager(workspace_dir=workspace)
+        repo_manager.wait_for_cleanup()
+        assert os.listdir(workspace) == [".staging-in-progress"]
+        print("✓ Verified reaping of leftovers")
+
 if __name__ == "__main__":
     test_repository_manager()
-    test_repository_analysis() 
\ No newline at end of file
+    test_repository_analysis()
+    test_repository_tree_packaging()
+    test_workspace_replace_directory()
+    test_workspace_failed_swap_keeps_target()
+    test_workspace_lru_eviction()
+    test_workspace_reaps_leftovers() 
\ No newline at end of file
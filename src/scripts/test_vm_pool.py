@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from unittest import mock
+import vm_pool
+import deploy_app
+from vm_pool import VMPool
+
+VM_DETAILS = {
+    "resource_group_name": "test-resource-group",
+    "vm_name": "test-windows-vm",
+}
+
+class FakeTerraform:
+    """Stands in for Terraform: records each applied slot set and fails the first `failures` applies"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.applied = []
+
+    def _slots(self, terraform_dir):
+        with open(os.path.join(terraform_dir, "terraform.tfvars.json")) as f:
+            return json.load(f)["pool_slots"]
+
+    def deploy(self, terraform_dir):
+        self.applied.append(self._slots(terraform_dir))
+        if self.failures:
+            self.failures -= 1
+            return False
+        return True
+
+    def output(self, command, terraform_dir):
+        vms = {key: {"vm_name": f"vm-{key}", "public_ip": "10.0.0.4"} for key in self._slots(terraform_dir)}
+        return json.dumps(vms), None
+
+@contextmanager
+def _pool(terraform, terraform_dir=None, details=VM_DETAILS, **kwargs):
+    """Runs a VMPool against `terraform`, in a temporary directory unless `terraform_dir` is given"""
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(vm_pool, "deploy_with_terraform", terraform.deploy), \
+            mock.patch.object(vm_pool, "run_terraform_command", terraform.output), \
+            mock.patch.object(vm_pool, "POLL_INTERVAL", 0.01):
+        pool = VMPool(details, terraform_dir=terraform_dir or tmp, **kwargs)
+        try:
+            yield pool
+        finally:
+            pool.shutdown()
+
+def _states(pool):
+    """Slot states as persisted in the pool state file"""
+    with open(pool.state_path) as f:
+        return {key: slot["state"] for key, slot in json.load(f).items()}
+
+def _set_leased_at(pool, key, leased_at):
+    """Backdates a lease in the pool state file"""
+    with open(pool.state_path) as f:
+        slots = json.load(f)
+    slots[key]["leased_at"] = leased_at
+    with open(pool.state_path, "w") as f:
+        json.dump(slots, f)
+
+def _wait_for(predicate, timeout: float = 5):
+    """Polls `predicate` until it holds or `timeout` seconds pass"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    assert False, "Timed out waiting for the pool"
+
+def test_acquire_leases_and_replenishes():
+    """Test that acquire hands out a VM and the pool is topped back up"""
+    terraform = FakeTerraform()
+    with _pool(terraform, pool_size=2) as pool:
+        vm = pool.acquire(timeout=5)
+        assert vm is not None, "Expected a pooled VM"
+        assert vm["vm_name"] == f"vm-{vm['pool_slot']}"
+        # The pool has its own resource group, apart from cold provisioning
+        assert vm["resource_group_name"] == "test-resource-group-pool"
+        assert _states(pool)[vm["pool_slot"]] == "leased"
+
+        _wait_for(lambda: list(_states(pool).values()).count("available") == 2)
+        assert len(terraform.applied[-1]) == 3
+        print("✓ Verified acquire and replenishment")
+
+def test_release_destroy():
+    """Test that a destroyed VM's slot is dropped from the Terraform slot set"""
+    terraform = FakeTerraform()
+    with _pool(terraform, pool_size=1) as pool:
+        vm = pool.acquire(timeout=5)
+        pool.release(vm)
+        assert vm["pool_slot"] not in _states(pool)
+        _wait_for(lambda: terraform.applied and vm["pool_slot"] not in terraform.applied[-1]
+                  and "leased" not in _states(pool).values())
+        print("✓ Verified release with destroy")
+
+def test_release_recycle():
+    """Test that a recycled VM is reset and handed out again, or destroyed if the reset fails"""
+    terraform = FakeTerraform()
+    with _pool(terraform, pool_size=1, release_policy="recycle") as pool, \
+            mock.patch.object(vm_pool.subprocess, "run") as run:
+        vm = pool.acquire(timeout=5)
+        pool.release(vm)
+        script = run.call_args[0][0][-1]
+        assert "Stop-Process" in script and "Remove-Item" in script
+        assert _states(pool)[vm["pool_slot"]] == "available"
+
+        run.side_effect = subprocess.CalledProcessError(1, "az")
+        vm = pool.acquire(timeout=5)
+        pool.release(vm)
+        assert vm["pool_slot"] not in _states(pool)
+        print("✓ Verified release with recycle")
+
+def test_recovers_after_failed_apply():
+    """Test that a failed apply does not leave acquire waiting and is retried"""
+    terraform = FakeTerraform(failures=1)
+    with _pool(terraform, pool_size=1, retry_delay=60) as pool:
+        # Nothing is ready and the apply failed, so acquire gives up at once
+        started = time.time()
+        assert pool.acquire(timeout=30) is None
+        assert time.time() - started < 5
+
+    terraform = FakeTerraform(failures=1)
+    with _pool(terraform, pool_size=1, retry_delay=0.05) as pool:
+        _wait_for(lambda: len(terraform.applied) >= 2)
+        vm = pool.acquire(timeout=5)
+        assert vm is not None, "Expected a pooled VM after the retried apply"
+        # The retry applied the same slot instead of stranding it in provisioning
+        assert terraform.applied[0] == terraform.applied[1] == [vm["pool_slot"]]
+        print("✓ Verified recovery after a failed apply")
+
+def test_deploy_releases_vm_on_any_failure():
+    """Test that deploy_to_vm returns its pooled VM even on errors other than az failures"""
+    terraform = FakeTerraform()
+    with _pool(terraform, pool_size=1) as pool, \
+            mock.patch.object(deploy_app, "package_application", side_effect=OSError("disk full")):
+        try:
+            deploy_app.deploy_to_vm("./workspace", VM_DETAILS, pool)
+            assert False, "Expected the packaging error to propagate"
+        except OSError:
+            pass
+        assert "leased" not in _states(pool).values()
+        print("✓ Verified pooled VM release on failure")
+
+def test_pools_share_state():
+    """Test that pools sharing a directory never hand out the same VM and keep the first configuration"""
+    terraform = FakeTerraform()
+    with tempfile.TemporaryDirectory() as tmp:
+        other_details = {"resource_group_name": "other-group", "vm_name": "other-vm"}
+        with _pool(terraform, terraform_dir=tmp, pool_size=2) as first, \
+                _pool(terraform, terraform_dir=tmp, details=other_details, pool_size=2) as second:
+            first_vm = first.acquire(timeout=5)
+            second_vm = second.acquire(timeout=5)
+            assert first_vm is not None and second_vm is not None
+            assert first_vm["pool_slot"] != second_vm["pool_slot"]
+            assert second_vm["resource_group_name"] == "test-resource-group-pool"
+            assert _states(first)[first_vm["pool_slot"]] == _states(first)[second_vm["pool_slot"]] == "leased"
+
+        # Neither pool's apply dropped the other's lease
+        assert {first_vm["pool_slot"], second_vm["pool_slot"]} <= set(terraform.applied[-1])
+        print("✓ Verified shared pool state")
+
+def test_release_deployed_slot_by_name():
+    """Test that a deployed VM can be released by name from another pool instance"""
+    terraform = FakeTerraform()
+    with tempfile.TemporaryDirectory() as tmp:
+        with _pool(terraform, terraform_dir=tmp, pool_size=1) as pool:
+            vm = pool.acquire(timeout=5)
+            pool.mark_deployed(vm)
+            assert _states(pool)[vm["pool_slot"]] == "deployed"
+
+        with _pool(terraform, terraform_dir=tmp, pool_size=1) as pool:
+            pool.release_slot(vm["vm_name"])
+            assert vm["pool_slot"] not in _states(pool)
+            try:
+                pool.release_slot("no-such-vm")
+                assert False, "Expected an unknown VM to be rejected"
+            except ValueError:
+                pass
+        assert vm["pool_slot"] not in terraform.applied[-1]
+        print("✓ Verified release by name")
+
+def test_stale_leases_are_reclaimed():
+    """Test that a VM leased by a run that never finished its deploy is destroyed"""
+    terraform = FakeTerraform()
+    with tempfile.TemporaryDirectory() as tmp:
+        with _pool(terraform, terraform_dir=tmp, pool_size=1) as pool:
+            stale = pool.acquire(timeout=5)
+            deployed = pool.acquire(timeout=5)
+            pool.mark_deployed(deployed)
+        _set_leased_at(pool, stale["pool_slot"], time.time() - 2 * 60 * 60)
+
+        with _pool(terraform, terraform_dir=tmp, pool_size=1) as pool:
+            _wait_for(lambda: stale["pool_slot"] not in _states(pool))
+        assert stale["pool_slot"] not in terraform.applied[-1]
+        assert _states(pool)[deployed["pool_slot"]] == "deployed"
+        print("✓ Verified reclaiming stale leases")
+
+if __name__ == "__main__":
+    test_acquire_leases_and_replenishes()
+    test_release_destroy()
+    test_release_recycle()
+    test_recovers_after_failed_apply()
+    test_deploy_releases_vm_on_any_failure()
+    test_pools_share_state()
+    test_release_deployed_slot_by_name()
+    test_stale_leases_are_reclaimed()
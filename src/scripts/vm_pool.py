@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import uuid
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+from terraform_manager import (
+    generate_pool_terraform_config, pool_resource_group_name, deploy_with_terraform, run_terraform_command
+)
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Slot states tracked in the pool state file
+PROVISIONING = "provisioning"
+AVAILABLE = "available"
+LEASED = "leased"        # handed out, deploy in progress
+DEPLOYED = "deployed"    # running an application until released
+
+# Keys of the deploy details that define the pool's infrastructure
+POOL_CONFIG_KEYS = (
+    "subscription_id", "resource_group_name", "location",
+    "vm_name", "admin_username", "admin_password",
+)
+
+# Failed applies are retried with exponential backoff up to this delay
+MAX_RETRY_DELAY = 15 * 60
+
+# How often acquire() re-reads the state file for VMs provisioned by other processes
+POLL_INTERVAL = 5
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock on `path`, shared by every process using the same pool directory"""
+    with open(path, "a") as lock_file:
+        if os.name == "nt":
+            # msvcrt only offers a bounded blocking lock, so poll until it is free
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class VMPool:
+    """
+    Keeps `pool_size` pre-provisioned, runtime-ready Windows VMs so a deploy only
+    has to install the application. All VMs live in one Terraform configuration
+    keyed by slot (`for_each`); a background worker runs the Terraform applies,
+    replenishing the pool after each hand-out or destroyed return.
+
+    Several processes may share a pool directory: the slot table is re-read and
+    written under a file lock, and applies are serialized by a second lock.
+    The worker is a daemon thread, so the owning process must call shutdown()
+    before exiting; otherwise a running `terraform apply` is killed midway,
+    leaving the state locked and slots stuck in provisioning.
+    """
+
+    def __init__(self, details: Optional[Dict[str, str]] = None, pool_size: int = 2,
+                 terraform_dir: str = "./terraform_pool", release_policy: str = "destroy",
+                 retry_delay: float = 30, stale_lease_seconds: float = 60 * 60):
+        """
+        Args:
+            details (dict, optional): VM configuration, same keys as generate_terraform_config.
+                Only used to create a new pool: the first run saves it to pool_config.json
+                and later runs keep that saved configuration, so per-deploy details can
+                never rename or move VMs that are already provisioned.
+            pool_size (int): Number of VMs to keep ready for hand-out.
+            terraform_dir (str): Directory holding the pool's Terraform configuration and state.
+            release_policy (str): What release() does with a returned VM by default:
+                "destroy" tears it down and provisions a fresh one;
+                "recycle" stops the running app, deletes C:\\app and puts the VM back.
+                Packages installed by the previous app stay on the VM, so only recycle
+                VMs that will be redeployed with the same application.
+            retry_delay (float): Seconds before retrying a failed apply; doubles on
+                each consecutive failure, up to MAX_RETRY_DELAY.
+            stale_lease_seconds (float): Leased VMs whose deploy has not been confirmed
+                with mark_deployed() within this time are taken to belong to a crashed
+                run and are destroyed.
+        """
+        if release_policy not in ("recycle", "destroy"):
+            raise ValueError("release_policy must be either 'recycle' or 'destroy'")
+
+        self.pool_size = pool_size
+        self.terraform_dir = terraform_dir
+        self.release_policy = release_policy
+        self.retry_delay = retry_delay
+        self.stale_lease_seconds = stale_lease_seconds
+        self.config_path = os.path.join(terraform_dir, "pool_config.json")
+        self.state_path = os.path.join(terraform_dir, "pool_state.json")
+        self._state_lock_path = os.path.join(terraform_dir, "pool_state.lock")
+        self._apply_lock_path = os.path.join(terraform_dir, "terraform_apply.lock")
+
+        os.makedirs(terraform_dir, exist_ok=True)
+        self._condition = threading.Condition()
+        with self._locked_state():
+            self.details = self._load_or_save_config(details)
+
+        self._sync_requested = threading.Event()
+        self._stopped = threading.Event()
+        # A sync is requested or running (including retries after a failure)
+        self._sync_pending = False
+        self._sync_failed = False
+        self._worker = threading.Thread(target=self._run, name="vm-pool-replenisher", daemon=True)
+        self._worker.start()
+        self._request_sync()
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[Dict[str, str]]:
+        """
+        Hands out a ready VM, waiting up to `timeout` seconds while one is being provisioned.
+        Returns the VM details (as accepted by deploy_to_vm), or None if no VM became
+        ready: on timeout, after the last apply failed, or once the pool is shut down.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        vm_details = None
+        requested = False
+        with self._condition:
+            while True:
+                with self._locked_state():
+                    key = self._available_slot()
+                    if key is not None:
+                        self._slots[key]["state"] = LEASED
+                        self._slots[key]["leased_at"] = time.time()
+                        self._save_state()
+                        vm_details = self._vm_details(key)
+                if vm_details is not None or self._sync_failed or self._stopped.is_set():
+                    break
+                if not self._sync_pending:
+                    if requested:
+                        break
+                    # Other users of the pool took every VM; provision one and wait for it
+                    self._request_sync()
+                    requested = True
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                # Another process sharing the pool may provision the VM, so poll the state file too
+                self._condition.wait(POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL))
+
+        # Replace the VM we just handed out, or retry provisioning if none was ready
+        self._request_sync()
+        return vm_details
+
+    def mark_deployed(self, vm_details: Dict[str, str]) -> None:
+        """Records that a leased VM now runs an application, so it is not reclaimed as stale"""
+        with self._locked_state():
+            slot = self._slots.get(vm_details["pool_slot"])
+            if slot is not None:
+                slot["state"] = DEPLOYED
+                slot["deployed_at"] = time.time()
+                self._save_state()
+
+    def shutdown(self) -> None:
+        """Stops the replenisher after it has run any requested sync, waiting for a running apply"""
+        self._stopped.set()
+        self._sync_requested.set()
+        self._worker.join()
+        with self._condition:
+            # Nothing will be provisioned any more, so waiting acquire() calls can give up
+            self._sync_pending = False
+            self._condition.notify_all()
+
+    def release(self, vm_details: Dict[str, str], policy: Optional[str] = None) -> None:
+        """Returns a VM obtained from acquire(), recycling or destroying it per `policy`"""
+        key = vm_details["pool_slot"]
+        policy = policy or self.release_policy
+
+        if policy == "recycle" and self._reset_vm(vm_details):
+            with self._locked_state():
+                if key in self._slots:
+                    self._slots[key]["state"] = AVAILABLE
+                    self._save_state()
+                self._condition.notify_all()
+            return
+
+        with self._locked_state():
+            self._slots.pop(key, None)
+            self._save_state()
+        self._request_sync()
+
+    def release_slot(self, name: str, policy: Optional[str] = None) -> None:
+        """Releases a pooled VM by slot key or VM name, e.g. one deployed by an earlier run"""
+        with self._locked_state():
+            key = next((key for key, slot in self._slots.items() if name in (key, slot["vm_name"])), None)
+            vm_details = self._vm_details(key) if key is not None else None
+        if vm_details is None:
+            raise ValueError(f"No pooled VM with slot or name '{name}'")
+        self.release(vm_details, policy)
+
+    @contextmanager
+    def _locked_state(self):
+        """Holds the pool locks and reloads the slot table, which may have been changed by another process"""
+        with self._condition, _file_lock(self._state_lock_path):
+            self._slots = self._load_state()
+            yield
+
+    def _load_or_save_config(self, details: Optional[Dict[str, str]]) -> Dict[str, str]:
+        """Returns the pool's saved configuration, saving `details` as it if the pool is new"""
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r") as f:
+                config = json.load(f)
+            if details and any(details.get(key) not in (None, config.get(key)) for key in POOL_CONFIG_KEYS):
+                print(f"Keeping the VM pool configuration saved in {self.config_path}")
+            return config
+
+        if details is None:
+            raise ValueError(f"No VM pool configuration in {self.config_path}; pass details to create one")
+        config = {key: details[key] for key in POOL_CONFIG_KEYS if details.get(key)}
+        with open(self.config_path, "w") as f:
+            json.dump(config, f, indent=2)
+        return config
+
+    def _available_slot(self) -> Optional[str]:
+        """Key of a slot ready for hand-out, if any"""
+        return next((key for key, slot in self._slots.items() if slot["state"] == AVAILABLE), None)
+
+    def _request_sync(self):
+        """Wakes the worker to bring the Terraform state in line with the pool"""
+        if self._stopped.is_set():
+            return
+        with self._condition:
+            # Set both under the lock so the worker never sees one without the other
+            self._sync_pending = True
+            self._sync_requested.set()
+
+    def _vm_details(self, key: str) -> Dict[str, str]:
+        """Builds the deploy_to_vm details for a pooled slot"""
+        slot = self._slots[key]
+        return {
+            **self.details,
+            "resource_group_name": pool_resource_group_name(self.details),
+            "vm_name": slot["vm_name"],
+            "public_ip": slot["public_ip"],
+            "pool_slot": key,
+        }
+
+    def _reset_vm(self, vm_details: Dict[str, str]) -> bool:
+        """Stops the deployed application and removes it from a VM so it can be handed out again"""
+        try:
+            subprocess.run([
+                "az", "vm", "run-command", "invoke",
+                "--command-id", "RunPowerShellScript",
+                "--name", vm_details["vm_name"],
+                "--resource-group", vm_details.get('resource_group_name') or 'default-resource-group',
+                "--scripts", """
+                    Get-Process -Name python, node -ErrorAction SilentlyContinue | Stop-Process -Force
+                    if (Test-Path 'C:\\app') { Remove-Item -Recurse -Force 'C:\\app' }
+                """
+            ], check=True)
+            return True
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to recycle {vm_details['vm_name']}, destroying it instead: {str(e)}")
+            return False
+
+    def _run(self):
+        """Background loop bringing the Terraform state in line with the pool"""
+        delay = self.retry_delay
+        while True:
+            self._sync_requested.wait()
+            with self._condition:
+                self._sync_requested.clear()
+                requested = self._sync_pending
+
+            succeeded = True
+            if requested:
+                try:
+                    succeeded = self._sync()
+                except Exception as e:
+                    print(f"VM pool replenishment failed: {str(e)}")
+                    succeeded = False
+
+                with self._condition:
+                    self._sync_failed = not succeeded
+                    self._sync_pending = not succeeded or self._sync_requested.is_set()
+                    self._condition.notify_all()
+
+            if self._stopped.is_set():
+                return
+            if succeeded:
+                delay = self.retry_delay
+                continue
+
+            # Slots stay in provisioning; retry them after a backoff unless shut down
+            print(f"VM pool replenishment failed, retrying in {delay} seconds")
+            if self._stopped.wait(delay):
+                return
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+            self._sync_requested.set()
+
+    def _sync(self) -> bool:
+        """Tops the pool up to pool_size and applies the slot set with Terraform; returns success"""
+        # Only one process may run terraform in the pool directory at a time
+        with _file_lock(self._apply_lock_path):
+            with self._locked_state():
+                self._reclaim_stale_leases()
+                ready = sum(1 for slot in self._slots.values() if slot["state"] in (PROVISIONING, AVAILABLE))
+                for _ in range(self.pool_size - ready):
+                    # Short keys keep the Windows computer name within 15 characters
+                    self._slots[uuid.uuid4().hex[:6]] = {"state": PROVISIONING, "vm_name": None, "public_ip": None}
+                self._save_state()
+                keys = list(self._slots)
+
+            generate_pool_terraform_config(self.details, self.terraform_dir)
+            with open(os.path.join(self.terraform_dir, "terraform.tfvars.json"), "w") as f:
+                json.dump({"pool_slots": keys}, f, indent=2)
+
+            print(f"Applying VM pool with {len(keys)} slot(s)...")
+            if not deploy_with_terraform(self.terraform_dir):
+                return False
+
+            output, error = run_terraform_command(["terraform", "output", "-json", "pool_vms"], self.terraform_dir)
+            if error:
+                return False
+            vms = json.loads(output)
+
+            with self._locked_state():
+                for key in keys:
+                    slot = self._slots.get(key)
+                    if slot is None or key not in vms:
+                        continue
+                    slot["vm_name"] = vms[key]["vm_name"]
+                    slot["public_ip"] = vms[key]["public_ip"]
+                    if slot["state"] == PROVISIONING:
+                        slot["state"] = AVAILABLE
+                self._save_state()
+        return True
+
+    def _reclaim_stale_leases(self):
+        """Drops leased slots whose deploy never completed, so the next apply destroys them"""
+        now = time.time()
+        for key, slot in list(self._slots.items()):
+            if slot["state"] == LEASED and now - slot.get("leased_at", 0) > self.stale_lease_seconds:
+                print(f"Reclaiming pooled VM {slot['vm_name']}: its deploy never completed")
+                del self._slots[key]
+
+    def _load_state(self) -> Dict[str, dict]:
+        """Loads the persisted slot table, if any"""
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def _save_state(self):
+        """Persists the slot table; written to a temp file and renamed so it is never torn"""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._slots, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+# Release a pooled VM once its deployment is no longer needed:
+#   python vm_pool.py release <slot-or-vm-name> [recycle|destroy]
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "release":
+        print("Usage: python vm_pool.py release <slot-or-vm-name> [recycle|destroy]")
+        sys.exit(1)
+
+    pool = VMPool(pool_size=int(os.getenv("DEPLOYAI_VM_POOL_SIZE", "2")))
+    try:
+        pool.release_slot(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+    finally:
+        pool.shutdown()